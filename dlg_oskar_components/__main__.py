@@ -1,7 +1,7 @@
 # __main__ is not required for DALiuGE components.
 import argparse  # pragma: no cover
 
-from . import MyAppDROP  # pragma: no cover
+from . import __all__ as components  # pragma: no cover
 
 
 def main() -> None:  # pragma: no cover
@@ -51,10 +51,9 @@ def main() -> None:  # pragma: no cover
     if args.verbose:
         print("Verbose mode is on.")
 
-    print("Executing main function")
-    comp = MyAppDROP()
-    print(comp.run())
-    print("End of main function")
+    print("Available components:")
+    for component in components:
+        print(f"  {component}")
 
 
 if __name__ == "__main__":  # pragma: no cover
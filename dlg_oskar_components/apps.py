@@ -9,14 +9,14 @@ then result in a single EAGLE palette.
 
 Be creative! do whatever you need to do!
 """
+import functools
 import logging
 import io
+import threading
+from types import MappingProxyType
 from typing import List
 
-import numpy as np
 import json
-import oskar
-import matplotlib.pyplot as plt
 import dlg.droputils
 
 from dlg.drop import BarrierAppDROP, BranchAppDrop
@@ -36,6 +36,125 @@ from dlg.parset_drop import ParameterSetDROP, DEFAULT_INTERNAL_PARAMETERS
 
 logger = logging.getLogger(__name__)
 
+# numpy, oskar, matplotlib and PIL are imported where used so that workers only
+# registering this palette do not pay their (considerable) import cost.
+
+# Images with at least this many pixels are colour-mapped with the numba
+# kernel, when the optional numba extra is installed
+_NUMBA_MIN_PIXELS = 2048 * 2048
+
+# Parsing a settings schema is expensive, so each worker thread keeps one
+# tree per schema
+_settings_cache = threading.local()
+
+
+def _settings_tree(schema: str, values: dict):
+    """Returns this thread's cached oskar.SettingsTree for schema, set to
+    values.
+
+    Keys written by a previous run on this thread that are not in values are
+    put back to their schema defaults first, so the tree ends up exactly as a
+    fresh tree with values applied would be. A value of None also means the
+    default.
+    """
+    trees = getattr(_settings_cache, "trees", None)
+    if trees is None:
+        trees = _settings_cache.trees = {}
+    if schema not in trees:
+        import oskar
+
+        trees[schema] = (oskar.SettingsTree(schema), {})
+    tree, defaults = trees[schema]
+
+    for key in defaults.keys() - values.keys():
+        tree[key] = defaults[key]
+    for key, value in values.items():
+        if key not in defaults:
+            # Read before the first write, so still the default
+            defaults[key] = tree[key]
+        tree[key] = defaults[key] if value is None else value
+    return tree
+
+
+@functools.lru_cache(maxsize=None)
+def _oskar_cuda_available() -> bool:
+    """Returns True if the installed OSKAR can use at least one CUDA device.
+
+    Probed once per process. Any failure (OSKAR built without CUDA, no driver,
+    no devices) counts as no GPU.
+    """
+    try:
+        import oskar
+
+        imager = oskar.Imager()
+        imager.set_gpus(-1)  # -1 selects every GPU; None would select none
+        return imager.num_gpus > 0
+    except Exception:
+        return False
+
+
+def _resolve_usegpu(usegpu) -> bool:
+    """Resolves a true/false/auto usegpu parameter to whether GPUs are used."""
+    if isinstance(usegpu, bool):
+        return usegpu
+    value = str(usegpu).strip().lower()
+    if value == "auto":
+        return _oskar_cuda_available()
+    if value in ("true", "1"):
+        return True
+    if value in ("false", "0", ""):
+        return False
+    raise DaliugeException(
+        f"usegpu must be one of true, false or auto, got {usegpu!r}"
+    )
+
+
+def _jet_lut():
+    """Returns the jet colormap as (N, 4) uint8 RGBA rows, plus its 'bad'
+    colour."""
+    import numpy as np
+    from matplotlib import cm
+
+    lut = cm.jet(np.arange(cm.jet.N), bytes=True)
+    bad = np.array(cm.jet(np.nan, bytes=True), dtype=np.uint8)
+    return lut, bad
+
+
+def _jet_u8(image):
+    """Normalises an image to its non-NaN range, maps it through jet and
+    flips it vertically. NaN pixels get the colormap's 'bad' colour."""
+    import numpy as np
+    from matplotlib import cm
+
+    pixels = np.flipud(image).astype(np.float64)
+    if np.isnan(pixels).all():
+        low = high = 0.0
+    else:
+        low, high = np.nanmin(pixels), np.nanmax(pixels)
+    return cm.jet((pixels - low) / (high - low + 1e-12), bytes=True)
+
+
+def _encode_and_write(image, output):
+    """Colour-maps an image with jet, encodes it as a PNG and writes it to
+    output."""
+    from PIL import Image
+
+    # Colour-map the pixels directly rather than rendering a matplotlib figure
+    pixels = None
+    if image.size >= _NUMBA_MIN_PIXELS:
+        try:
+            from .kernels import apply_lut_u8
+        except ImportError:  # numba is an optional extra
+            logger.debug("numba not available, colour-mapping with numpy")
+        else:
+            pixels = apply_lut_u8(image, *_jet_lut())
+    if pixels is None:
+        pixels = _jet_u8(image)
+
+    out_io = io.BytesIO()
+    Image.fromarray(pixels).save(out_io, "PNG", compress_level=1)
+    output.write(out_io.getbuffer())
+
 
 ##
 # @brief OSKARInterferometer
@@ -49,8 +168,12 @@ logger = logging.getLogger(__name__)
 #     \~English Estimated execution time
 # @param[in] cparam/num_cpus No. of CPUs/1/Integer/readonly/False//False/
 #     \~English Number of cores used
-# @param[in] aparam/doubleprecision Double Precision/true/Boolean/readwrite/
+#     Values above 1 also cap the number of threads OSKAR uses when not
+#     running on GPUs.
+# @param[in] aparam/doubleprecision Double Precision/false/Boolean/readwrite/
 #     \~English Whether to use double (true) or float (false) precision.
+#     Switch to double precision for long baselines or high dynamic range
+#     simulations, where single precision phase errors become significant.
 # @param[in] aparam/usegpu Use GPU/false/Boolean/readwrite/
 #     \~English Whether to use gpu capabilities (true) or CPU only (false).
 # @param[in] aparam/channel_bandwidth_hz Channel bandwith/0/Double/readwrite/
@@ -81,7 +204,7 @@ class OSKARInterferometer(BarrierAppDROP):
     """Configures and runs an OSKAR interferometer simulation
     """
 
-    compontent_meta = dlg_component(
+    component_meta = dlg_component(
         "OSKARInterferometer",
         "OSKAR Interferometer",
         [dlg_batch_input("binary/*", [])],
@@ -89,12 +212,13 @@ class OSKARInterferometer(BarrierAppDROP):
         [dlg_streaming_input("binary/*")],
     )
 
-    doubleprecision = dlg_bool_param("doubleprecision", True)
+    doubleprecision = dlg_bool_param("doubleprecision", False)
     usegpu = dlg_bool_param("usegpu", False)
     channel_bandwidth_hz = dlg_float_param("channel_bandwidth_hz", 0.0)
     time_average_sec = dlg_float_param("time_average_sec", 0.0)
     force_polarised_ms = dlg_bool_param("force_polarised_ms", False)
     ignore_w_components = dlg_bool_param("ignore_w_components", False)
+    num_cpus = dlg_int_param("num_cpus", 1)
 
     def initialize(self, **kwargs):
         super(OSKARInterferometer, self).initialize(**kwargs)
@@ -106,36 +230,49 @@ class OSKARInterferometer(BarrierAppDROP):
         """
         The run method is mandatory for DALiuGE application components.
         """
+        import numpy as np
+        import oskar
+
         if len(self.outputs) < 1:
             raise Exception("No where for the visibilities to go")
         if len(self.inputs) < 3:
             raise Exception("Make sure to connect a skymodel and telescope model")
         # Basic settings. (Note that the sky model is set up later.)
-        params = {
-            "simulator": {
-                "use_gpus": self.usegpu
-            },
-            "observation": self._fetch_config(),
-            "telescope": {
-                "input_directory": self.inputs[0].path  # TODO: support named ports
-            },
-            "interferometer": {
-                "oskar_vis_filename": self.outputs[0].path,
-                "ms_filename": "",
-                "channel_bandwidth_hz": self.channel_bandwidth_hz,
-                "time_average_sec": self.time_average_sec,
-                "force_polarised_ms": self.force_polarised_ms,
-                "ignore_w_components": self.ignore_w_components
-            }
+        values = {
+            "simulator/use_gpus": self.usegpu,
+            # Set the numerical precision to use.
+            "simulator/double_precision": self.doubleprecision,
+            # TODO: support named ports
+            "telescope/input_directory": self.inputs[0].path,
+            # OSKAR writes straight into the output drop's file; nothing is
+            # read back here
+            "interferometer/oskar_vis_filename": self.outputs[0].path,
+            "interferometer/ms_filename": "",
+            "interferometer/channel_bandwidth_hz": self.channel_bandwidth_hz,
+            "interferometer/time_average_sec": self.time_average_sec,
+            "interferometer/force_polarised_ms": self.force_polarised_ms,
+            "interferometer/ignore_w_components": self.ignore_w_components,
         }
-        settings = oskar.SettingsTree("oskar_sim_interferometer")
-        settings.from_dict(params)
-
-        # Set the numerical precision to use.
-        settings["simulator/double_precision"] = self.doubleprecision
+        for key, value in self._fetch_config().items():
+            values[f"observation/{key}"] = value
+        # Without GPUs, num_devices is the number of CPU threads OSKAR spawns.
+        # Only an explicit CPU budget (above the palette's default of 1)
+        # limits it; otherwise OSKAR's default of using every core applies,
+        # as it always has.
+        if not self.usegpu and self.num_cpus > 1:
+            values["simulator/num_devices"] = self.num_cpus
+        else:
+            values["simulator/num_devices"] = None
+        settings = _settings_tree("oskar_sim_interferometer", values)
 
         # Create a sky model containing three sources from a numpy array.
-        sky_data = load_npy(self.inputs[1])
+        # File-backed sky models are memory-mapped so only the transposing
+        # copy below reads them.
+        sky_path = getattr(self.inputs[1], "path", None)
+        if sky_path:
+            sky_data = np.load(sky_path, mmap_mode="r")
+        else:
+            sky_data = load_npy(self.inputs[1])
         """  # Below kept for example
         sky_data = numpy.array([
             [20.0, -30.0, 1, 0, 0, 0, 100.0e6, -0.7, 0.0, 0, 0, 0],
@@ -144,9 +281,19 @@ class OSKARInterferometer(BarrierAppDROP):
         """
         if self.doubleprecision:
             temp_precision = "double"
+            dtype = np.float64
         else:
             temp_precision = "single"
-        sky = oskar.Sky.from_array(sky_data, temp_precision)  # Pass precision here.
+            dtype = np.float32
+        # Hand OSKAR one contiguous column per source property (RA, Dec, I,
+        # Q, U, V, ...) of matching precision, rather than a row per source.
+        # This is not zero-copy: the transpose and cast make one full copy
+        # of the catalogue, which is also the only pass over a mapped file.
+        sky_columns = np.ascontiguousarray(
+            np.atleast_2d(sky_data).T, dtype=dtype
+        )
+        sky = oskar.Sky(precision=temp_precision)  # Pass precision here.
+        sky.append_sources(*sky_columns)
 
         # Set the sky model and run the simulation.
         sim = oskar.Interferometer(settings=settings)
@@ -166,10 +313,13 @@ class OSKARInterferometer(BarrierAppDROP):
 #     \~English Estimated execution time
 # @param[in] cparam/num_cpus No. of CPUs/1/Integer/readonly/False//False/
 #     \~English Number of cores used
-# @param[in] aparam/doubleprecision Double Precision/true/Boolean/readwrite/
+# @param[in] aparam/doubleprecision Double Precision/false/Boolean/readwrite/
 #     \~English Whether to use double (true) or float (false) precision.
-# @param[in] aparam/usegpu Use GPU/false/Boolean/readwrite/
-#     \~English Whether to use gpu capabilities (true) or CPU only (false).
+#     Switch to double precision when imaging high dynamic range fields.
+# @param[in] aparam/usegpu Use GPU/auto/String/readwrite/
+#     \~English Whether to use gpu capabilities (true), CPU only (false),
+#     or (auto) run gridding and FFT on the GPU whenever OSKAR can use a
+#     CUDA device.
 # @param[in] aparam/specify_cellsize Specify Cellsize/false/Boolean/readwrite/
 #     \~English If set, specify cellsize; otherwise, specify field of view
 # @param[in] aparam/fov_deg FOV degrees/2/Double/readwrite/
@@ -225,7 +375,7 @@ class OSKARInterferometer(BarrierAppDROP):
 class OSKARImager(BarrierAppDROP):
     """Configures and runs an OSKAR imager simulation
     """
-    compontent_meta = dlg_component(
+    component_meta = dlg_component(
         "OSKARImager",
         "OSKAR Imager",
         [dlg_batch_input("binary/*", [])],
@@ -233,8 +383,8 @@ class OSKARImager(BarrierAppDROP):
         [dlg_streaming_input("binary/*")],
     )
 
-    doubleprecision = dlg_bool_param("doubleprecision", True)
-    usegpu = dlg_bool_param("usegpu", False)
+    doubleprecision = dlg_bool_param("doubleprecision", False)
+    usegpu = dlg_string_param("usegpu", "auto")
     specify_cellsize = dlg_bool_param("specify_cellsize", False)
     fov_deg = dlg_float_param("fov_deg", 2.0)
     cellsize_arcsec = dlg_float_param("cellsize_arcsec", 1.0)
@@ -259,42 +409,38 @@ class OSKARImager(BarrierAppDROP):
         """
         The run method is mandatory for DALiuGE application components.
         """
-        params = {
-            "image": {
-                "double_precision": 'true' if self.doubleprecision else 'false',
-                "use_gpus": 'true' if self.usegpu else 'false',
-                "specify_cellsize": self.specify_cellsize,
-                "fov_deg": self.fov_deg,
-                "cellsize_arcsec": self.cellsize_arcsec,
-                "size": self.size,
-                "image_type": self.image_type,
-                "channel_snapshots": self.channel_snapshots,
-                "freq_min_hz": self.freq_min_hz,
-                "freq_max_hz": self.freq_max_hz,
-                "time_min_utc": self.time_min_utc,
-                "time_max_utc": self.time_max_utc,
-                "uv_filter_min": self.uv_filter_min,
-                "uv_filter_max": self.uv_filter_max,
-                "algorithm": self.algorithm,
-                "weighting": self.weighting,
-                # "u_wavelengths": self.u_wavelengths,
-                # "v_wavelengths": self.v_wavelengths,
-                "input_vis_data": self.inputs[0].path
-            }
-        }
-        settings = oskar.SettingsTree("oskar_imager")
-        settings.from_dict(params)
+        import oskar
+
+        use_gpu = 'true' if _resolve_usegpu(self.usegpu) else 'false'
+        precision = 'true' if self.doubleprecision else 'false'
+        settings = _settings_tree("oskar_imager", {
+            "image/double_precision": precision,
+            "image/use_gpus": use_gpu,
+            "image/fft/use_gpu": use_gpu,
+            "image/fft/grid_on_gpu": use_gpu,
+            "image/specify_cellsize": self.specify_cellsize,
+            "image/fov_deg": self.fov_deg,
+            "image/cellsize_arcsec": self.cellsize_arcsec,
+            "image/size": self.size,
+            "image/image_type": self.image_type,
+            "image/channel_snapshots": self.channel_snapshots,
+            "image/freq_min_hz": self.freq_min_hz,
+            "image/freq_max_hz": self.freq_max_hz,
+            "image/time_min_utc": self.time_min_utc,
+            "image/time_max_utc": self.time_max_utc,
+            "image/uv_filter_min": self.uv_filter_min,
+            "image/uv_filter_max": self.uv_filter_max,
+            "image/algorithm": self.algorithm,
+            "image/weighting": self.weighting,
+            # "image/u_wavelengths": self.u_wavelengths,
+            # "image/v_wavelengths": self.v_wavelengths,
+            "image/input_vis_data": self.inputs[0].path
+        })
         imager = oskar.Imager(settings=settings)
         image = imager.run(return_images=1)["images"][0]
-
-        im = plt.imshow(image, cmap="jet")
-        plt.gca().invert_yaxis()
-        plt.colorbar(im)
-
-        out_io = io.BytesIO()
-        plt.savefig(out_io)
-        out_io.seek(0)
-        self.outputs[0].write(out_io.getbuffer())
+        # Written synchronously: the output drop is completed as soon as run()
+        # returns
+        _encode_and_write(image, self.outputs[0])
 
 
 ##
@@ -321,6 +467,14 @@ class OSKARImager(BarrierAppDROP):
 #     \~English A valid OSKAR observation json for each output
 # @par EAGLE_END
 class OSKARConfigScatter(BarrierAppDROP):
+    """Splits an OSKAR observation configuration into contiguous frequency
+    ranges.
+
+    Only the (small) observation json is replicated per output; the telescope
+    and sky models are shared by every downstream interferometer through their
+    own drops and are never copied here.
+    """
+
     component_meta = dlg_component(
         "OSKARConfigScatter",
         "Splits an OSKAR observation configuration by frequency",
@@ -334,6 +488,10 @@ class OSKARConfigScatter(BarrierAppDROP):
     START_FREQ_FETCH = "start_frequency_hz"
     FREQ_INCR = "frequency_inc_hz"
     NUM_CHANNELS = "num_channels"
+    # Observation settings assumed when the configuration does not provide them
+    OBS_DEFAULTS = MappingProxyType(
+        {START_FREQ_FETCH: 100e6, NUM_CHANNELS: 6, FREQ_INCR: 20e6}
+    )
 
     def run(self):
         if len(self.inputs) * self.num_of_copies != len(self.outputs):
@@ -343,9 +501,10 @@ class OSKARConfigScatter(BarrierAppDROP):
             )
 
         original_config = json.loads(allDropContents(self.inputs[0]))
-        start_frequency = original_config.get(self.START_FREQ_FETCH, 100e6)
-        num_channels_total = original_config.get(self.NUM_CHANNELS, 6)
-        frequency_increment = original_config.get(self.FREQ_INCR, 20e6)
+        config = {**self.OBS_DEFAULTS, **original_config}
+        start_frequency = config[self.START_FREQ_FETCH]
+        num_channels_total = config[self.NUM_CHANNELS]
+        frequency_increment = config[self.FREQ_INCR]
 
         num_channels_local = num_channels_total // self.num_of_copies
 
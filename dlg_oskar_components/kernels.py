@@ -0,0 +1,42 @@
+"""
+Numba kernels used by the dlg_oskar_components application components.
+
+This module is only imported from within run() methods, keeping numba's
+import and compilation cost off workers that never execute these DROPs.
+numba is an optional dependency (the ``numba`` extra); callers fall back to
+numpy when it cannot be imported.
+"""
+import numpy as np
+from numba import njit, prange
+
+
+@njit(parallel=True, cache=True)
+def apply_lut_u8(image, lut, bad):
+    """Normalises a 2D image to its non-NaN range, maps it through a uint8
+    colour look-up table and flips it vertically, all in a single pass.
+
+    Produces the same pixels as calling a matplotlib colormap of len(lut)
+    entries (with bytes=True) on the normalised image; NaN pixels get ``bad``.
+    """
+    height, width = image.shape
+    num_colours = lut.shape[0]
+    low = np.float64(np.nanmin(image))
+    denom = np.float64(np.nanmax(image)) - low + 1e-12
+    out = np.empty((height, width, lut.shape[1]), dtype=np.uint8)
+    for i in prange(height):
+        row = height - 1 - i
+        for j in range(width):
+            value = np.float64(image[i, j])
+            if np.isnan(value):
+                out[row, j, :] = bad
+                continue
+            # Same arithmetic and clamping as matplotlib's Colormap.__call__
+            scaled = (value - low) / denom * num_colours
+            if scaled >= num_colours:
+                idx = num_colours - 1
+            elif scaled < 0:
+                idx = 0
+            else:
+                idx = int(scaled)
+            out[row, j, :] = lut[idx]
+    return out
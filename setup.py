@@ -42,5 +42,8 @@ setup(
     entry_points={
         "console_scripts": ["dlg_oskar_components = dlg_oskar_components.__main__:main"]
     },
-    extras_require={"test": read_requirements("requirements-test.txt")},
+    extras_require={
+        "test": read_requirements("requirements-test.txt"),
+        "numba": ["numba>=0.55"],
+    },
 )
@@ -12,3 +12,92 @@ def go_to_tmpdir(request):
     # Chdir only for the duration of the test.
     with tmpdir.as_cwd():
         yield
+
+
+class FakeSettingsTree:
+    """Stands in for oskar.SettingsTree: unset keys read back as their
+    default."""
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.values = {}
+        FakeSettingsTree.created.append(self)
+
+    @staticmethod
+    def default(key):
+        return f"<default {key}>"
+
+    def __getitem__(self, key):
+        return self.values.get(key, self.default(key))
+
+    def __setitem__(self, key, value):
+        self.values[key] = value
+
+
+class FakeSky:
+    def __init__(self, precision=None):
+        self.precision = precision
+        self.columns = []
+
+    def append_sources(self, *columns):
+        self.columns = columns
+
+
+class FakeInterferometer:
+    """Records the settings each simulation ran with."""
+
+    def __init__(self, precision=None, settings=None):
+        self.runs = []
+        self.settings = dict(settings.values)
+        FakeInterferometer.created.append(self)
+
+    def set_sky_model(self, sky):
+        self.sky = sky
+
+    def run(self):
+        self.runs.append(self.settings)
+
+
+class FakeImager:
+    """Follows oskar.Imager's GPU selection: all available GPUs by default,
+    -1 for all of them, None for none, or a list of device ids."""
+
+    available_gpus = 0
+
+    def __init__(self, precision=None, settings=None):
+        self.settings = dict(settings.values) if settings is not None else {}
+        self.num_gpus = self.available_gpus
+
+    def set_gpus(self, device_ids):
+        if device_ids is None:
+            self.num_gpus = 0
+        elif device_ids == -1:
+            self.num_gpus = self.available_gpus
+        else:
+            self.num_gpus = len(device_ids)
+
+    def run(self, return_images=0):
+        import numpy as np
+
+        return {"images": [np.arange(16.0).reshape(4, 4)]}
+
+
+@pytest.fixture
+def fake_oskar(monkeypatch):
+    """Replaces the oskar package (not installable from PyPI) with recording
+    fakes, and clears the per-process OSKAR caches kept by the components."""
+    import threading
+    import types
+
+    from dlg_oskar_components import apps
+
+    module = types.ModuleType("oskar")
+    module.SettingsTree = FakeSettingsTree
+    module.Sky = FakeSky
+    module.Interferometer = FakeInterferometer
+    module.Imager = FakeImager
+    FakeSettingsTree.created = []
+    FakeInterferometer.created = []
+    monkeypatch.setitem(sys.modules, "oskar", module)
+    monkeypatch.setattr(apps, "_settings_cache", threading.local())
+    return module
@@ -1,10 +1,385 @@
+import io
+import json
+import sys
+
+import numpy as np
 import pytest
+from dlg.drop import BarrierAppDROP, FileDROP, InMemoryDROP
+from dlg.droputils import allDropContents, save_npy
+from dlg.exceptions import DaliugeException
+from dlg.meta import dlg_component
+from PIL import Image
 
-from dlg_oskar_components import OSKARInterferometer
+from dlg_oskar_components import (
+    OSKARConfigScatter,
+    OSKARImager,
+    OSKARInterferometer,
+)
+from dlg_oskar_components import apps
+from dlg_oskar_components.apps import (
+    _encode_and_write,
+    _jet_lut,
+    _resolve_usegpu,
+    _settings_tree,
+)
 
 given = pytest.mark.parametrize
 
 
 def test_OSKARInterferometer_class():
-    assert False
+    app = OSKARInterferometer("sim", "sim")
+    assert isinstance(app, BarrierAppDROP)
+    assert app.doubleprecision is False
+
+
+@given("component", [OSKARInterferometer, OSKARImager, OSKARConfigScatter])
+def test_component_meta(component):
+    assert isinstance(component.component_meta, dlg_component)
+
+
+def test_main_lists_components(monkeypatch, capsys):
+    from dlg_oskar_components.__main__ import main
+
+    monkeypatch.setattr(sys, "argv", ["dlg_oskar_components", "tester"])
+    main()
+    out = capsys.readouterr().out
+    for name in ("OSKARInterferometer", "OSKARImager", "OSKARConfigScatter"):
+        assert f"  {name}" in out
+
+
+ONE_SOURCE = np.array([[20.0, -30.0, 1, 0, 0, 0, 100.0e6, -0.7, 0.0, 0, 0, 0]])
+
+# Columns: RA, Dec, I, Q, U, V, ref freq, spectral index, RM, maj, min, PA
+THREE_SOURCES = np.array(
+    [
+        [20.0, -30.0, 1, 0, 0, 0, 100.0e6, -0.7, 0.0, 0, 0, 0],
+        [20.0, -30.5, 3, 2, 2, 0, 100.0e6, -0.7, 0.0, 600, 50, 45],
+        [20.5, -30.5, 3, 0, 0, 2, 100.0e6, -0.7, 0.0, 700, 10, -10],
+    ]
+)
+
+
+def _interferometer(
+    tmpdir, name, config, sky_data=ONE_SOURCE, sky_file=False, **kwargs
+):
+    """An OSKARInterferometer wired to telescope, sky model and config
+    inputs. With sky_file the sky model is stored in a FileDROP."""
+    app = OSKARInterferometer(name, name, **kwargs)
+    telescope = _file_drop(tmpdir, f"{name}_tm", f"{name}.tm")
+    if sky_file:
+        sky = _file_drop(tmpdir, f"{name}_sky", f"{name}_sky.npy")
+    else:
+        sky = InMemoryDROP(f"{name}_sky", f"{name}_sky")
+    save_npy(sky, sky_data)
+    sky.setCompleted()
+    settings = InMemoryDROP(f"{name}_config", f"{name}_config")
+    settings.write(json.dumps(config).encode("utf-8"))
+    settings.setCompleted()
+    vis = _file_drop(tmpdir, f"{name}_vis", f"{name}.vis")
+    for drop in (telescope, sky, settings):
+        app.addInput(drop)
+    app.addOutput(vis)
+    return app
+
+
+def _file_drop(tmpdir, uid, filename):
+    return FileDROP(uid, uid, filepath=str(tmpdir.join(filename)))
+
+
+def _read_png(drop):
+    drop.setCompleted()
+    return np.asarray(Image.open(io.BytesIO(allDropContents(drop))))
+
+
+def test_png_is_colour_mapped_image():
+    image = np.zeros((4, 6))
+    image[-1, 0] = 1.0
+    output = InMemoryDROP("png", "png")
+    _encode_and_write(image, output)
+
+    pixels = _read_png(output)
+    lut, _ = _jet_lut()
+    assert pixels.shape == (4, 6, 4)
+    # Images are displayed with the origin at the bottom, so the PNG is flipped
+    np.testing.assert_array_equal(pixels[0, 0], lut[-1])
+    np.testing.assert_array_equal(pixels[-1, 0], lut[0])
+    np.testing.assert_array_equal(pixels[0, -1], lut[0])
+
+
+def test_settings_tree_is_reused_without_leaking_keys(fake_oskar):
+    first = _settings_tree(
+        "oskar_sim_interferometer",
+        {
+            "observation/phase_centre_ra_deg": 20.0,
+            "observation/length": "01:00:00",
+            "observation/num_channels": 3,
+        },
+    )
+    second = _settings_tree(
+        "oskar_sim_interferometer",
+        {"observation/num_channels": 6, "observation/num_time_steps": 24},
+    )
+
+    assert second is first
+    assert len(fake_oskar.SettingsTree.created) == 1
+    assert second["observation/num_channels"] == 6
+    assert second["observation/num_time_steps"] == 24
+    default = fake_oskar.SettingsTree.default
+    assert second["observation/phase_centre_ra_deg"] == default(
+        "observation/phase_centre_ra_deg"
+    )
+    assert second["observation/length"] == default("observation/length")
+
+
+def test_settings_tree_per_schema(fake_oskar):
+    interferometer = _settings_tree(
+        "oskar_sim_interferometer", {"simulator/use_gpus": True}
+    )
+    imager = _settings_tree("oskar_imager", {"image/size": 256})
+    assert interferometer is not imager
+    assert imager.schema == "oskar_imager"
+    assert imager["simulator/use_gpus"] == fake_oskar.SettingsTree.default(
+        "simulator/use_gpus"
+    )
+
+
+def test_interferometer_runs_do_not_share_observation(fake_oskar, tmpdir):
+    first = _interferometer(
+        tmpdir,
+        "first",
+        {
+            "phase_centre_ra_deg": 20.0,
+            "length": "01:00:00",
+            "num_channels": 3,
+        },
+    )
+    second = _interferometer(tmpdir, "second", {"num_time_steps": 24})
+    first.run()
+    second.run()
+
+    default = fake_oskar.SettingsTree.default
+    (tree,) = fake_oskar.SettingsTree.created
+    assert tree["observation/num_time_steps"] == 24
+    assert tree["observation/phase_centre_ra_deg"] == default(
+        "observation/phase_centre_ra_deg"
+    )
+    assert tree["observation/length"] == default("observation/length")
+    assert tree["telescope/input_directory"] == str(tmpdir.join("second.tm"))
+
+
+def _scatter(config, num_of_copies):
+    app = OSKARConfigScatter("scatter", "scatter", num_of_copies=num_of_copies)
+    settings = InMemoryDROP("config", "config")
+    settings.write(json.dumps(config).encode("utf-8"))
+    settings.setCompleted()
+    app.addInput(settings)
+    outputs = [
+        InMemoryDROP(f"out{i}", f"out{i}") for i in range(num_of_copies)
+    ]
+    for output in outputs:
+        app.addOutput(output)
+    app.run()
+    for output in outputs:
+        output.setCompleted()
+    return [json.loads(allDropContents(output)) for output in outputs]
+
+
+def test_scatter_uses_observation_defaults():
+    configs = _scatter({"phase_centre_ra_deg": 20.0}, 2)
+    assert [c["start_frequency_hz"] for c in configs] == [100e6, 160e6]
+    assert [c["num_channels"] for c in configs] == [3, 3]
+    assert all(c["phase_centre_ra_deg"] == 20.0 for c in configs)
+
+
+def test_scatter_prefers_config_values():
+    configs = _scatter(
+        {
+            "start_frequency_hz": 50e6,
+            "num_channels": 4,
+            "frequency_inc_hz": 1e6,
+        },
+        2,
+    )
+    assert [c["start_frequency_hz"] for c in configs] == [50e6, 52e6]
+    assert [c["num_channels"] for c in configs] == [2, 2]
+
+
+def test_interferometer_applies_config_as_given(fake_oskar, tmpdir):
+    _interferometer(tmpdir, "sim", {"num_time_steps": 24}).run()
+    (tree,) = fake_oskar.SettingsTree.created
+    assert tree.values["observation/num_time_steps"] == 24
+    assert "observation/num_channels" not in tree.values
+    assert "observation/frequency_inc_hz" not in tree.values
+
+
+@given(
+    "kwargs, expected",
+    [
+        ({}, None),
+        ({"num_cpus": 1}, None),
+        ({"num_cpus": 4}, 4),
+        ({"num_cpus": 4, "usegpu": True}, None),
+    ],
+)
+def test_interferometer_num_devices(fake_oskar, tmpdir, kwargs, expected):
+    # A previous CPU drop on the same thread must not leave its thread count
+    # behind
+    _interferometer(tmpdir, "previous", {}, num_cpus=8).run()
+    _interferometer(tmpdir, "sim", {}, **kwargs).run()
+
+    (tree,) = fake_oskar.SettingsTree.created
+    if expected is None:
+        expected = fake_oskar.SettingsTree.default("simulator/num_devices")
+    assert tree["simulator/num_devices"] == expected
+
+
+def _imager(tmpdir, name, **kwargs):
+    app = OSKARImager(name, name, **kwargs)
+    vis_path = str(tmpdir.join(f"{name}.vis"))
+    app.addInput(FileDROP(f"{name}_vis", f"{name}_vis", filepath=vis_path))
+    app.addOutput(InMemoryDROP(f"{name}_png", f"{name}_png"))
+    return app
+
+
+def test_imager_sets_every_leaf_on_each_run(fake_oskar, tmpdir):
+    _imager(tmpdir, "first", size=512, algorithm="W-Projection").run()
+    (tree,) = fake_oskar.SettingsTree.created
+    first_keys = set(tree.values)
+
+    _imager(tmpdir, "second").run()
+    assert set(tree.values) == first_keys
+    assert tree["image/size"] == 256
+    assert tree["image/algorithm"] == "FFT"
+    assert tree["image/input_vis_data"] == str(tmpdir.join("second.vis"))
+
+
+def test_interferometer_runs_own_simulator(fake_oskar, tmpdir):
+    _interferometer(tmpdir, "first", {}).run()
+    _interferometer(tmpdir, "second", {}).run()
+
+    first_sim, second_sim = fake_oskar.Interferometer.created
+    ((first,), (second,)) = first_sim.runs, second_sim.runs
+    assert first["telescope/input_directory"] == str(tmpdir.join("first.tm"))
+    assert first["interferometer/oskar_vis_filename"] == str(
+        tmpdir.join("first.vis")
+    )
+    assert second["telescope/input_directory"] == str(tmpdir.join("second.tm"))
+    assert second["interferometer/oskar_vis_filename"] == str(
+        tmpdir.join("second.vis")
+    )
+
+
+@given(
+    "usegpu, cuda, expected",
+    [
+        ("auto", True, True),
+        ("auto", False, False),
+        ("true", False, True),
+        ("false", True, False),
+        (True, False, True),
+        (False, True, False),
+    ],
+)
+def test_resolve_usegpu(monkeypatch, usegpu, cuda, expected):
+    monkeypatch.setattr(apps, "_oskar_cuda_available", lambda: cuda)
+    assert _resolve_usegpu(usegpu) is expected
+
+
+def test_resolve_usegpu_rejects_unknown_values():
+    with pytest.raises(DaliugeException):
+        _resolve_usegpu("sometimes")
+
+
+@given("available_gpus, expected", [(0, False), (2, True)])
+def test_oskar_cuda_probe_is_cached(
+    fake_oskar, monkeypatch, available_gpus, expected
+):
+    monkeypatch.setattr(fake_oskar.Imager, "available_gpus", available_gpus)
+    apps._oskar_cuda_available.cache_clear()
+    assert apps._oskar_cuda_available() is expected
+    monkeypatch.setattr(
+        fake_oskar.Imager, "available_gpus", 2 - available_gpus
+    )
+    assert apps._oskar_cuda_available() is expected
+    apps._oskar_cuda_available.cache_clear()
+
+
+def test_oskar_cuda_probe_without_gpu_support(fake_oskar, monkeypatch):
+    # An OSKAR built without CUDA: selecting GPUs fails
+    def set_gpus(self, device_ids):
+        raise RuntimeError("OSKAR was compiled without CUDA support")
+
+    monkeypatch.setattr(fake_oskar.Imager, "set_gpus", set_gpus)
+    apps._oskar_cuda_available.cache_clear()
+    assert apps._oskar_cuda_available() is False
+    apps._oskar_cuda_available.cache_clear()
+
+
+def test_imager_usegpu_auto(fake_oskar, monkeypatch, tmpdir):
+    monkeypatch.setattr(apps, "_oskar_cuda_available", lambda: True)
+    _imager(tmpdir, "gpu").run()
+    (tree,) = fake_oskar.SettingsTree.created
+    assert tree["image/use_gpus"] == "true"
+    assert tree["image/fft/grid_on_gpu"] == "true"
+
+    _imager(tmpdir, "cpu", usegpu="false").run()
+    assert tree["image/use_gpus"] == "false"
+    assert tree["image/fft/use_gpu"] == "false"
+
+
+def test_interferometer_memory_maps_file_sky_model(
+    fake_oskar, monkeypatch, tmpdir
+):
+    _interferometer(tmpdir, "memory", {}, sky_data=THREE_SOURCES).run()
+
+    mmap_modes = []
+    real_load = np.load
+
+    def load(*args, **kwargs):
+        mmap_modes.append(kwargs.get("mmap_mode"))
+        return real_load(*args, **kwargs)
+
+    def load_npy(drop):
+        raise AssertionError("file-backed sky model read through load_npy")
+
+    monkeypatch.setattr(np, "load", load)
+    monkeypatch.setattr(apps, "load_npy", load_npy)
+    _interferometer(
+        tmpdir, "file", {}, sky_data=THREE_SOURCES, sky_file=True
+    ).run()
+
+    assert mmap_modes == ["r"]
+    from_memory, from_file = fake_oskar.Interferometer.created
+    assert len(from_file.sky.columns) == len(from_memory.sky.columns)
+    for file_column, memory_column in zip(
+        from_file.sky.columns, from_memory.sky.columns
+    ):
+        np.testing.assert_array_equal(file_column, memory_column)
+
+
+@given(
+    "doubleprecision, dtype, precision",
+    [(False, np.float32, "single"), (True, np.float64, "double")],
+)
+def test_interferometer_sky_columns(
+    fake_oskar, tmpdir, doubleprecision, dtype, precision
+):
+    _interferometer(
+        tmpdir,
+        "sim",
+        {},
+        sky_data=THREE_SOURCES,
+        doubleprecision=doubleprecision,
+    ).run()
 
+    (sim,) = fake_oskar.Interferometer.created
+    sky = sim.sky
+    assert sky.precision == precision
+    assert len(sky.columns) == THREE_SOURCES.shape[1]
+    ra, dec, stokes_i = sky.columns[:3]
+    np.testing.assert_array_equal(ra, np.array([20.0, 20.0, 20.5], dtype))
+    np.testing.assert_array_equal(dec, np.array([-30.0, -30.5, -30.5], dtype))
+    np.testing.assert_array_equal(stokes_i, np.array([1, 3, 3], dtype))
+    for column in sky.columns:
+        assert column.dtype == dtype
+        assert column.flags["C_CONTIGUOUS"]
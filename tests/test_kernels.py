@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from dlg_oskar_components.apps import _jet_lut, _jet_u8
+
+kernels = pytest.importorskip("dlg_oskar_components.kernels")
+
+given = pytest.mark.parametrize
+
+
+def _with_nans(image):
+    image = image.copy()
+    image[0, 1] = np.nan
+    image[5, 3] = np.nan
+    return image
+
+
+rng = np.random.default_rng(1234)
+
+
+@given(
+    "image",
+    [
+        rng.normal(size=(32, 48)),
+        rng.normal(size=(32, 48)).astype(np.float32),
+        np.full((16, 16), 3.5),
+        _with_nans(rng.normal(size=(16, 24))),
+        np.full((8, 8), np.nan),
+    ],
+    ids=["random", "random_float32", "constant", "with_nans", "all_nans"],
+)
+def test_apply_lut_u8_matches_numpy_path(image):
+    expected = _jet_u8(image)
+    result = kernels.apply_lut_u8(image, *_jet_lut())
+    assert result.dtype == np.uint8
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_nan_pixels_get_bad_colour():
+    image = _with_nans(rng.normal(size=(16, 24)))
+    _, bad = _jet_lut()
+    pixels = _jet_u8(image)
+    # The image is flipped vertically, so row 0 ends up last
+    np.testing.assert_array_equal(pixels[-1, 1], bad)
+    np.testing.assert_array_equal(pixels[-6, 3], bad)